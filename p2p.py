@@ -1,8 +1,11 @@
+import csv
 import json
+import math
+import os
 import sys
 import random
 import time
-from collections import deque, defaultdict
+from collections import Counter, deque, defaultdict
 from typing import Dict, Set, List, Tuple, Optional
 import networkx as nx
 import matplotlib.pyplot as plt
@@ -16,6 +19,12 @@ class Node:
         self.neighbors: Set[str] = set()
         # cache[resource_id] = set(node_ids que possuem o recurso)
         self.cache: Dict[str, Set[str]] = defaultdict(set)
+        # cache_hits[resource_id] = nº de buscas bem-sucedidas que passaram
+        # por este nó para o recurso (define as entradas "quentes" do gossip)
+        self.cache_hits: Dict[str, int] = defaultdict(int)
+        # gossip_hits[resource_id] = popularidade recebida dos vizinhos via
+        # gossip, já atenuada (não conta como busca que passou pelo nó)
+        self.gossip_hits: Dict[str, int] = defaultdict(int)
 
     def add_neighbor(self, neighbor_id: str):
         if neighbor_id == self.id:
@@ -24,10 +33,14 @@ class Node:
 
 
 class P2PNetwork:
+    ALGORITHMS = ("flooding", "informed_flooding", "random_walk", "informed_random_walk")
+
     def __init__(self, config: dict):
         self.nodes: Dict[str, Node] = {}
         self.min_neighbors = config["min_neighbors"]
         self.max_neighbors = config["max_neighbors"]
+        # Mensagens de gossip são contabilizadas separadamente das de busca
+        self.gossip_msg_count = 0
 
         # Cria nós
         for node_id, res_list in config["resources"].items():
@@ -48,6 +61,12 @@ class P2PNetwork:
         self._validate_degrees()
         self._validate_connected()
 
+        # Listas ordenadas para sorteio reprodutível de consultas
+        self._node_ids = sorted(self.nodes)
+        self._resource_ids = sorted(
+            {r for node in self.nodes.values() for r in node.resources}
+        )
+
     def _validate_degrees(self):
         for node in self.nodes.values():
             deg = len(node.neighbors)
@@ -81,7 +100,108 @@ class P2PNetwork:
         de que 'target_id' possui 'resource_id'.
         """
         for node_id in path:
-            self.nodes[node_id].cache[resource_id].add(target_id)
+            node = self.nodes[node_id]
+            node.cache[resource_id].add(target_id)
+            node.cache_hits[resource_id] += 1
+
+    # ---------- Gossip (replicação proativa de cache) ----------
+
+    def _hottest_entries(self, node: Node, top_k: int) -> List[Tuple[str, Set[str], int]]:
+        """
+        Retorna as 'top_k' entradas de cache mais populares do nó
+        como (resource_id, holders, hits). A popularidade é a observada
+        localmente somada à recebida via gossip.
+        """
+        entries = [
+            (res, holders, node.cache_hits[res] + node.gossip_hits[res])
+            for res, holders in node.cache.items()
+            if holders
+        ]
+        entries.sort(key=lambda e: (-e[2], e[0]))
+        return entries[:top_k]
+
+    def gossip_round(self, budget: int, top_k: int = 3,
+                     announce_resources: bool = False) -> int:
+        """
+        Executa uma rodada de gossip: cada nó (em ordem aleatória) envia
+        para seus vizinhos suas 'top_k' entradas de cache mais quentes e,
+        se 'announce_resources', os recursos que ele mesmo possui.
+        Cada envio nó -> vizinho conta como uma mensagem e a rodada para
+        ao atingir 'budget' mensagens.
+        Retorna o nº de mensagens de gossip enviadas na rodada.
+        """
+        sent = 0
+        order = list(self.nodes)
+        random.shuffle(order)
+
+        for node_id in order:
+            if sent >= budget:
+                break
+            node = self.nodes[node_id]
+
+            payload = self._hottest_entries(node, top_k)
+            if announce_resources:
+                payload += [(res, {node_id}, 0) for res in sorted(node.resources)]
+            if not payload:
+                continue
+
+            for neigh_id in sorted(node.neighbors):
+                if sent >= budget:
+                    break
+                neigh = self.nodes[neigh_id]
+                sent += 1
+                for res, holders, hits in payload:
+                    # O próprio vizinho não precisa saber que possui o recurso
+                    neigh.cache[res].update(h for h in holders if h != neigh_id)
+                    # Popularidade recebida é atenuada a cada salto, para que o
+                    # conteúdo quente se espalhe sem ofuscar o observado localmente
+                    neigh.gossip_hits[res] = max(neigh.gossip_hits[res], hits // 2)
+
+        self.gossip_msg_count += sent
+        return sent
+
+    def gossip(self, rounds: int, budget: int, top_k: int = 3,
+               announce_resources: bool = False,
+               seed: Optional[int] = None) -> int:
+        """
+        Executa 'rounds' rodadas de gossip com orçamento de 'budget'
+        mensagens por rodada.
+        Retorna o total de mensagens de gossip enviadas.
+        """
+        if rounds < 1:
+            raise ValueError("rounds deve ser pelo menos 1")
+        if top_k < 0:
+            raise ValueError("top_k não pode ser negativo")
+
+        if seed is not None:
+            random.seed(seed)
+
+        total = 0
+        for _ in range(rounds):
+            total += self.gossip_round(budget, top_k, announce_resources)
+        return total
+
+    def random_query(self) -> Tuple[str, str]:
+        """
+        Sorteia (node_id, resource_id) para uma consulta usando o
+        estado atual do módulo random.
+        """
+        return random.choice(self._node_ids), random.choice(self._resource_ids)
+
+    def warm_up(self, num_queries: int, ttl: int, algo: str, seed: int = 0) -> int:
+        """
+        Executa 'num_queries' buscas com origem e recurso sorteados para
+        popular os caches (e cache_hits) antes do gossip. A busca i usa a
+        semente seed + i.
+        Retorna o total de mensagens de busca trocadas.
+        """
+        total = 0
+        for i in range(num_queries):
+            random.seed(seed + i)
+            node_id, resource_id = self.random_query()
+            _, msg_count, _, _ = self.search(node_id, resource_id, ttl, algo, seed=seed + i)
+            total += msg_count
+        return total
 
     # ---------- Visualização ----------
 
@@ -289,7 +409,7 @@ class P2PNetwork:
             
             # Busca informada
             if informed and resource_id in node.cache and node.cache[resource_id]:
-                target_id = next(iter(node.cache[resource_id]))
+                target_id = min(node.cache[resource_id])
                 msg_count += 1
                 path2 = path + [target_id]
                 nodes_involved.add(target_id)
@@ -306,7 +426,7 @@ class P2PNetwork:
                 continue
             
             # Envia para vizinhos não visitados
-            for neigh_id in node.neighbors:
+            for neigh_id in sorted(node.neighbors):
                 if neigh_id not in visited:
                     visited.add(neigh_id)
                     nodes_involved.add(neigh_id)
@@ -363,7 +483,7 @@ class P2PNetwork:
             
             # Busca informada
             if informed and resource_id in node.cache and node.cache[resource_id]:
-                target_id = next(iter(node.cache[resource_id]))
+                target_id = min(node.cache[resource_id])
                 msg_count += 1
                 path.append(target_id)
                 visited.add(target_id)
@@ -377,7 +497,7 @@ class P2PNetwork:
                 return animation_steps
             
             # Encontra vizinhos não visitados
-            unvisited_neighbors = [n for n in node.neighbors if n not in visited]
+            unvisited_neighbors = [n for n in sorted(node.neighbors) if n not in visited]
             
             if unvisited_neighbors and current_ttl > 0:
                 next_id = random.choice(unvisited_neighbors)
@@ -464,7 +584,7 @@ class P2PNetwork:
 
             # Se for "informado" e o nó souber quem tem o recurso
             if informed and resource_id in node.cache and node.cache[resource_id]:
-                target_id = next(iter(node.cache[resource_id]))
+                target_id = min(node.cache[resource_id])
                 msg_count += 1
                 path2 = path + [target_id]
                 self._update_cache_on_hit(path2, resource_id, target_id)
@@ -476,7 +596,7 @@ class P2PNetwork:
                 continue
 
             # Envia para todos os vizinhos não visitados (flood)
-            for neigh_id in node.neighbors:
+            for neigh_id in sorted(node.neighbors):
                 if neigh_id not in visited:
                     visited.add(neigh_id)
                     nodes_involved.add(neigh_id)
@@ -517,7 +637,7 @@ class P2PNetwork:
 
             # Se for informado e souber alguém que possua o recurso
             if informed and resource_id in node.cache and node.cache[resource_id]:
-                target_id = next(iter(node.cache[resource_id]))
+                target_id = min(node.cache[resource_id])
                 msg_count += 1
                 path.append(target_id)
                 visited.add(target_id)
@@ -525,7 +645,7 @@ class P2PNetwork:
                 return True, msg_count, len(visited), path
 
             # Encontra vizinhos não visitados
-            unvisited_neighbors = [n for n in node.neighbors if n not in visited]
+            unvisited_neighbors = [n for n in sorted(node.neighbors) if n not in visited]
 
             if unvisited_neighbors and current_ttl > 0:
                 # Escolhe vizinho aleatório não visitado
@@ -549,6 +669,193 @@ class P2PNetwork:
         return False, msg_count, len(visited), []
 
 
+class ResultWriter:
+    """
+    Grava resultados de busca em CSV de forma colunar e em blocos:
+    as linhas ficam em buffer (uma lista por coluna) e são descarregadas
+    no arquivo a cada 'chunk_size' linhas, mantendo a memória constante.
+    Se o arquivo já existir, os resultados são anexados ao final, desde
+    que o cabeçalho dele seja igual a COLUMNS.
+    """
+
+    COLUMNS = [
+        "algo", "node_id", "resource_id", "ttl", "seed", "found",
+        "msg_count", "nodes_involved", "path_len", "elapsed_ms",
+        "gossip", "gossip_msgs",
+    ]
+
+    def __init__(self, path: str, chunk_size: int = 10000):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size deve ser positivo")
+        self.chunk_size = chunk_size
+        self.columns: Dict[str, list] = {col: [] for col in self.COLUMNS}
+        self.rows_written = 0
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not write_header:
+            with open(path, "r", newline="", encoding="utf-8") as f:
+                header = next(csv.reader(f), [])
+            if header != self.COLUMNS:
+                raise ValueError(
+                    f"Cabeçalho de {path} incompatível: esperado {','.join(self.COLUMNS)}"
+                )
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        if write_header:
+            self._writer.writerow(self.COLUMNS)
+
+    def write(self, **row):
+        for col in self.COLUMNS:
+            self.columns[col].append(row[col])
+        if len(self.columns["algo"]) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        chunk = [self.columns[col] for col in self.COLUMNS]
+        self._writer.writerows(zip(*chunk))
+        self.rows_written += len(chunk[0])
+        for col in self.COLUMNS:
+            self.columns[col].clear()
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_batch(net: P2PNetwork, num_queries: int, ttl: int, algo: str,
+              output_path: str, seed: int = 0, gossip_every: int = 0,
+              gossip_rounds: int = 1, gossip_budget: int = 0,
+              gossip_top_k: int = 3, announce_resources: bool = False,
+              chunk_size: int = 10000) -> int:
+    """
+    Executa 'num_queries' buscas com origem e recurso sorteados e grava
+    cada resultado via ResultWriter. A busca i usa a semente seed + i.
+    Se 'gossip_every' > 0, executa 'gossip_rounds' rodadas de gossip a
+    cada 'gossip_every' buscas. A coluna gossip descreve o agendamento
+    ("-" se desligado) e gossip_msgs registra as mensagens de gossip
+    enviadas logo antes de cada busca.
+    Retorna o nº de linhas gravadas.
+    """
+    # Valida antes de abrir o arquivo para não deixar um CSV incompleto
+    if algo.lower() not in P2PNetwork.ALGORITHMS:
+        raise ValueError(f"Algoritmo desconhecido: {algo}")
+    if num_queries < 0:
+        raise ValueError("num_queries não pode ser negativo")
+    if gossip_every > 0 and gossip_budget <= 0:
+        raise ValueError("gossip_budget deve ser positivo quando gossip_every > 0")
+    if gossip_rounds < 1:
+        raise ValueError("gossip_rounds deve ser pelo menos 1")
+    if gossip_top_k < 0:
+        raise ValueError("gossip_top_k não pode ser negativo")
+
+    schedule = "-"
+    if gossip_every > 0:
+        schedule = (f"every={gossip_every};rounds={gossip_rounds};"
+                    f"budget={gossip_budget};top_k={gossip_top_k}")
+        if announce_resources:
+            schedule += ";announce"
+
+    with ResultWriter(output_path, chunk_size) as writer:
+        for i in range(num_queries):
+            query_seed = seed + i
+            random.seed(query_seed)
+            # Sorteia a consulta antes do gossip para que execuções com e sem
+            # gossip, com a mesma semente, façam as mesmas consultas
+            node_id, resource_id = net.random_query()
+
+            gossip_msgs = 0
+            if gossip_every > 0 and i > 0 and i % gossip_every == 0:
+                gossip_msgs = net.gossip(gossip_rounds, gossip_budget,
+                                         gossip_top_k, announce_resources)
+
+            start = time.perf_counter()
+            found, msg_count, nodes_involved, path = net.search(
+                node_id=node_id,
+                resource_id=resource_id,
+                ttl=ttl,
+                algo=algo,
+                seed=query_seed,
+            )
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            writer.write(
+                algo=algo,
+                node_id=node_id,
+                resource_id=resource_id,
+                ttl=ttl,
+                seed=query_seed,
+                found=int(found),
+                msg_count=msg_count,
+                nodes_involved=nodes_involved,
+                path_len=len(path),
+                elapsed_ms=f"{elapsed_ms:.4f}",
+                gossip=schedule,
+                gossip_msgs=gossip_msgs,
+            )
+
+    return writer.rows_written
+
+
+def _percentile(hist: Counter, total: int, q: float) -> int:
+    """
+    Percentil pelo método nearest-rank a partir de um histograma
+    {valor: ocorrências}.
+    """
+    rank = max(1, math.ceil(total * q / 100))
+    seen = 0
+    for value in sorted(hist):
+        seen += hist[value]
+        if seen >= rank:
+            return value
+    return 0
+
+
+def aggregate_results(paths: List[str]) -> List[dict]:
+    """
+    Lê os CSVs gerados pelo ResultWriter linha a linha e calcula, por
+    (algoritmo, TTL, agendamento de gossip), a taxa de sucesso, os
+    percentis e a média de mensagens de busca e o custo de gossip por
+    busca. Guarda apenas um histograma de msg_count e somas por grupo,
+    então a memória não cresce com o nº de buscas.
+    """
+    groups: Dict[Tuple[str, int, str], dict] = {}
+    for path in paths:
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                key = (row["algo"], int(row["ttl"]), row["gossip"])
+                group = groups.setdefault(
+                    key, {"total": 0, "found": 0, "msgs": Counter(), "gossip_msgs": 0}
+                )
+                group["total"] += 1
+                group["found"] += int(row["found"])
+                group["msgs"][int(row["msg_count"])] += 1
+                group["gossip_msgs"] += int(row["gossip_msgs"])
+
+    summary = []
+    for (algo, ttl, gossip), group in sorted(groups.items()):
+        total = group["total"]
+        msg_total = sum(value * n for value, n in group["msgs"].items())
+        summary.append({
+            "algo": algo,
+            "ttl": ttl,
+            "gossip": gossip,
+            "queries": total,
+            "success_rate": group["found"] / total,
+            "msg_mean": msg_total / total,
+            "gossip_per_query": group["gossip_msgs"] / total,
+            "msg_p50": _percentile(group["msgs"], total, 50),
+            "msg_p90": _percentile(group["msgs"], total, 90),
+            "msg_p99": _percentile(group["msgs"], total, 99),
+        })
+    return summary
+
+
 def load_config(path: str) -> dict:
     """
     Espera um JSON no formato:
@@ -589,11 +896,33 @@ def main():
             "  search <node_id> <resource_id> <ttl> <algo> - Busca sem animação\n"
             "  animate <node_id> <resource_id> <ttl> <algo> - Busca com animação\n"
             "  animate <node_id> <resource_id> <ttl> <algo> <output.gif> - Salva animação\n"
+            "  gossip <warmup> <rounds> <budget> <node_id> <resource_id> <ttl> <algo>"
+            " [seed] [announce] - Aquecimento + gossip de cache antes da busca\n"
+            "  batch <num_queries> <ttl> <algo> <output.csv> [seed] [opções] - Buscas em lote para CSV\n"
+            "      opções: chunk_size=N gossip_every=K gossip_rounds=R gossip_budget=B"
+            " gossip_top_k=T announce\n"
             "  <node_id> <resource_id> <ttl> <algo> - Busca sem animação (atalho)\n"
+            "\nAgregação (não usa config):\n"
+            "  python p2p.py aggregate <results.csv> [...] - Resume resultados em lote\n"
             "\nAlgoritmos: flooding, informed_flooding, random_walk, informed_random_walk"
         )
         sys.exit(1)
 
+    if sys.argv[1] == "aggregate":
+        # Resumo dos CSVs gerados pelo comando batch
+        if len(sys.argv) < 3:
+            print("Uso: python p2p.py aggregate <results.csv> [...]")
+            sys.exit(1)
+        
+        print(f"{'Algoritmo':<22} {'TTL':>4} {'Buscas':>10} {'Sucesso':>8} "
+              f"{'Média':>7} {'p50':>6} {'p90':>6} {'p99':>6} {'Gossip/busca':>13}  Gossip")
+        for row in aggregate_results(sys.argv[2:]):
+            print(f"{row['algo']:<22} {row['ttl']:>4} {row['queries']:>10} "
+                  f"{row['success_rate']:>8.1%} {row['msg_mean']:>7.2f} "
+                  f"{row['msg_p50']:>6} {row['msg_p90']:>6} {row['msg_p99']:>6} "
+                  f"{row['gossip_per_query']:>13.2f}  {row['gossip']}")
+        return
+
     config_path = sys.argv[1]
     config = load_config(config_path)
     net = P2PNetwork(config)
@@ -654,6 +983,79 @@ def main():
         if found:
             print(f"Caminho: {' -> '.join(path)}")
     
+    elif sys.argv[2] == "gossip":
+        # Aquecimento (buscas que populam os caches), gossip proativo de
+        # cache e, por fim, a busca medida
+        if len(sys.argv) < 10:
+            print("Uso: python p2p.py <config.json> gossip <warmup> <rounds> <budget> "
+                  "<node_id> <resource_id> <ttl> <algo> [seed] [announce]")
+            sys.exit(1)
+        
+        warmup = int(sys.argv[3])
+        rounds = int(sys.argv[4])
+        budget = int(sys.argv[5])
+        node_id = sys.argv[6]
+        resource_id = sys.argv[7]
+        ttl = int(sys.argv[8])
+        algo = sys.argv[9]
+        extra = sys.argv[10:]
+        announce = "announce" in extra
+        seeds = [int(arg) for arg in extra if arg != "announce"]
+        seed = seeds[0] if seeds else 0
+        
+        warmup_msgs = net.warm_up(warmup, ttl, algo, seed=seed)
+        # rounds = 0 mede a mesma busca sem gossip (linha de base)
+        gossip_msgs = 0
+        if rounds != 0:
+            gossip_msgs = net.gossip(rounds, budget, announce_resources=announce, seed=seed)
+        found, msg_count, nodes_involved, path = net.search(
+            node_id=node_id,
+            resource_id=resource_id,
+            ttl=ttl,
+            algo=algo,
+            seed=seed,
+        )
+        
+        print(f"Mensagens de aquecimento: {warmup_msgs}")
+        print(f"Mensagens de gossip: {gossip_msgs}")
+        print(f"Encontrado: {found}")
+        print(f"Mensagens trocadas: {msg_count}")
+        print(f"Nós envolvidos: {nodes_involved}")
+        if found:
+            print(f"Caminho: {' -> '.join(path)}")
+    
+    elif sys.argv[2] == "batch":
+        # Buscas em lote gravadas em CSV
+        if len(sys.argv) < 7:
+            print("Uso: python p2p.py <config.json> batch <num_queries> <ttl> <algo> "
+                  "<output.csv> [seed] [chunk_size=N gossip_every=K gossip_rounds=R "
+                  "gossip_budget=B gossip_top_k=T announce]")
+            sys.exit(1)
+        
+        num_queries = int(sys.argv[3])
+        ttl = int(sys.argv[4])
+        algo = sys.argv[5]
+        output_path = sys.argv[6]
+        seed = 0
+        options = {}
+        announce = False
+        for arg in sys.argv[7:]:
+            if arg == "announce":
+                announce = True
+            elif "=" in arg:
+                key, value = arg.split("=", 1)
+                if key not in ("chunk_size", "gossip_every", "gossip_rounds",
+                               "gossip_budget", "gossip_top_k"):
+                    print(f"Opção desconhecida: {key}")
+                    sys.exit(1)
+                options[key] = int(value)
+            else:
+                seed = int(arg)
+        
+        rows = run_batch(net, num_queries, ttl, algo, output_path, seed,
+                         announce_resources=announce, **options)
+        print(f"{rows} resultados gravados em: {output_path}")
+    
     elif len(sys.argv) == 6:
         # Atalho: busca sem precisar escrever "search"
         # python p2p.py config.json <node_id> <resource_id> <ttl> <algo>